@@ -1,6 +1,17 @@
 import os
 from argparse import ArgumentTypeError
 
+# Allowed values of --mass_dict_type
+_MASS_DICT_TYPES = {"int": int, "float": float}
+
+
+def mass_dict_type(s: str):
+    """ retrieves the type of the mass dict. If unknown: raise Exception """
+    try:
+        return _MASS_DICT_TYPES[s.lower()]
+    except KeyError:
+        raise ArgumentTypeError("Unknown mass dict type: '{}'".format(s))
+
 
 def check_if_file_exists(s: str):
     """ checks if a file exists. If not: raise Exception """
@@ -10,10 +21,34 @@ def check_if_file_exists(s: str):
         raise Exception("File '{}' does not exists".format(s))
 
 
+def check_if_files_exist(files: list):
+    """ checks if all files exist (batched). If not: raise Exception """
+    # Scan each unique parent directory only once instead of
+    # issuing a stat call per file (relevant for large glob expansions)
+    dir_entries = dict()
+    for s in files:
+        directory = os.path.dirname(s) or "."
+        if directory not in dir_entries:
+            try:
+                with os.scandir(directory) as it:
+                    dir_entries[directory] = set(e.name for e in it if e.is_file())
+            except OSError:
+                # The directory may be unlistable while its files are still
+                # accessible (e.g. mode --x): fall back to per-file checks
+                dir_entries[directory] = None
+        entries = dir_entries[directory]
+        if entries is None:
+            if not os.path.isfile(s):
+                raise Exception("File '{}' does not exists".format(s))
+        elif os.path.basename(s) not in entries:
+            raise Exception("File '{}' does not exists".format(s))
+    return files
+
+
 def add_main_args(parser):
     # Needed Arguments for parsing (and other general/global arguments)
     parser.add_argument(
-        "files", type=check_if_file_exists, nargs="+",
+        "files", type=str, nargs="+",
         help="Files containing the Swissprot/EMBL-Entries (either in .dat or .txt)"
     )
     parser.add_argument(
@@ -31,11 +66,11 @@ def add_main_args(parser):
         "The default value is 'cores - 1', since one process is reserved for reading entries"
     )
     parser.add_argument(
-        "--output_csv", "-o", default=os.path.join(os.getcwd(), "protein_graph_statistics.csv"),
+        "--output_csv", "-o", default=None,
         type=str,
         help="Set the output file, which will contain information about the protein graphs (in csv) NOTE: "
-        "It will write to 'protein_graph_statistics.csv' and overwrite if such a file exists. Default is "
-        "set to the current working directory"
+        "It will overwrite such a file if it exists. If not set, no statistics are generated at all, "
+        "skipping their whole processing pipeline (useful for export-only runs)"
     )
 
     # Available headers
@@ -220,7 +255,7 @@ def add_graph_generation(group):
     )
     group.add_argument(
         "--mass_dict_type", "-mdt",
-        type=lambda s: int if s.lower() == "int" else (float if s.lower() == "float" else None), default="int",
+        type=mass_dict_type, default="int",
         choices=[int, float], metavar="{int,float}",
         help="Set the type of the mass dictionary for amino acid. Default is set to int"
     )
@@ -230,8 +265,9 @@ def add_graph_generation(group):
         "so that each mass can be converted into integers."
     )
     group.add_argument(
-        "--queue_size", "-qs", type=int, default=30000,
-        help="Set the size of the queues, default is 30000"
+        "--queue_size", "-qs", type=int, default=None,
+        help="Set the size of the queues. If not set, the size is derived from the"
+        " number of processes (keeping a few batches in flight per process)"
     )
 
 
@@ -44,8 +44,27 @@ class PepCitus(PepPostgres):
                 password=self.password,
                 dbname=self.database
             )
+            # Use server-side prepared statements from the first execution on,
+            # so the insert statements on the hot path are parsed/planned only once
+            self.conn.prepare_threshold = 0
             # Set a cursor
             self.cursor = self.conn.cursor(binary=True)
+            # Bulk-load session: do not wait for the WAL fsync on commit.
+            # Session-local setting; on a crash the last commits may be lost,
+            # but the database itself stays consistent
+            self.cursor.execute("SET synchronous_commit = OFF")
+
+            # Second connection, dedicated to peptides_meta (see PepPostgres)
+            self.conn_meta = psycopg.connect(
+                host=self.host,
+                port=self.port,
+                user=self.user,
+                password=self.password,
+                dbname=self.database
+            )
+            self.conn_meta.prepare_threshold = 0
+            self.cursor_meta = self.conn_meta.cursor(binary=True)
+            self.cursor_meta.execute("SET synchronous_commit = OFF")
         except Exception as e:
             raise Exception("Could not establish a connection to Postgres Citus (Peptides).", e)
 
@@ -134,7 +153,7 @@ class PepCitus(PepPostgres):
                 id BIGSERIAL,
                 peptides_id {0},
                 accession_id INT,
-                path INT[] NOT NULL,
+                path BYTEA NOT NULL,  -- packed int32 array (native endianness)
                 miscleavages INT NOT NULL,
                 PRIMARY KEY (id, peptides_id)
             );""".format("BIT(452)" if self.postgres_no_duplicates else "BIGINT"))
@@ -157,10 +176,17 @@ class PepCitus(PepPostgres):
         self.statement_peptides_inner_values = "(" + ",".join(["%s"]*len(self.peptides_keys)) + ")"
         self.statement_peptides_meta_inner_values = "(" + ",".join(["%s"]*len(self.peptides_meta_keys)) + ")"
 
+        # Create the session-local staging tables for COPY-based inserts
+        self._create_peptides_stage(kwargs["mass_dict_type"])
+
     def tear_down(self):
-        # Close the connection to postgres citus
+        # Close both connections to postgres citus
         try:
-            self.cursor.close()  # Close cursor
-            self.conn.close()  # Close connection
+            self.conn.commit()  # Commit the last (partial) batch of proteins
+            self.conn_meta.commit()
+            self.cursor.close()  # Close cursors
+            self.cursor_meta.close()
+            self.conn.close()  # Close connections
+            self.conn_meta.close()
         except Exception as e:
             print("Connection to PostgreSQL Citus could not be closed. (Reason: {})".format(str(e)))
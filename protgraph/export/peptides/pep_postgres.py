@@ -1,3 +1,6 @@
+from array import array
+
+import numpy as np
 import psycopg
 
 from protgraph.export.peptides.abstract_peptide_exporter import \
@@ -28,6 +31,21 @@ class PepPostgres(APeptideExporter):
         self.pg_max_allowed_entries_to_send_compressed = int(65535/30)  # --> deduced by the length of l_peptide_tuple
         self.pg_max_allowed_entries_to_send_meta = int(65535/4)  # --> deduced by the length of l_peptide_tuple
 
+        # The byte codes of all counted aminoacids (A-Z, used for vectorized counting)
+        self.aa_codes = np.frombuffer(b"ABCDEFGHIJKLMNOPQRSTUVWXYZ", dtype=np.uint8)
+
+        # Cache of the no-duplicates insert statements (keyed by chunk size),
+        # so the VALUES clause is not re-joined on every chunk
+        self.statement_peptides_no_dup = {}
+
+        # Cache of already inserted accessions and the commit bookkeeping.
+        # One transaction spans up to commit_every_n_proteins proteins, so we
+        # do not pay the fsync of a commit per protein. Trade-off: if a
+        # process crashes, the last (uncommitted) proteins are lost
+        self.accession_ids = {}
+        self.commit_every_n_proteins = 64
+        self.proteins_since_commit = 0
+
         # Connection and other parameters
         self.host = kwargs["pep_postgres_host"]  # Host
         self.port = kwargs["pep_postgres_port"]  # Port
@@ -45,8 +63,30 @@ class PepPostgres(APeptideExporter):
                 password=self.password,
                 dbname=self.database
             )
+            # Use server-side prepared statements from the first execution on,
+            # so the insert statements on the hot path are parsed/planned only once
+            self.conn.prepare_threshold = 0
             # Set a cursor
             self.cursor = self.conn.cursor(binary=True)
+            # Bulk-load session: do not wait for the WAL fsync on commit.
+            # Session-local setting; on a crash the last commits may be lost,
+            # but the database itself stays consistent
+            self.cursor.execute("SET synchronous_commit = OFF")
+
+            # Second connection, dedicated to peptides_meta. The meta staging
+            # and flushing then runs in its own session, so it shares no
+            # transaction/prepared-statement state with the peptide inserts
+            # and the server can write both tables concurrently
+            self.conn_meta = psycopg.connect(
+                host=self.host,
+                port=self.port,
+                user=self.user,
+                password=self.password,
+                dbname=self.database
+            )
+            self.conn_meta.prepare_threshold = 0
+            self.cursor_meta = self.conn_meta.cursor(binary=True)
+            self.cursor_meta.execute("SET synchronous_commit = OFF")
         except Exception as e:
             raise Exception("Could not establish a connection to Postgres (Peptides).", e)
 
@@ -134,7 +174,7 @@ class PepPostgres(APeptideExporter):
                 id BIGSERIAL,
                 peptides_id {0},
                 accession_id INT,
-                path INT[] NOT NULL,
+                path BYTEA NOT NULL,  -- packed int32 array (native endianness)
                 miscleavages INT NOT NULL,
                 PRIMARY KEY (id)
             );""".format("BIT(452)" if self.postgres_no_duplicates else "BIGINT"))
@@ -156,22 +196,81 @@ class PepPostgres(APeptideExporter):
         self.statement_peptides_inner_values = "(" + ",".join(["%s"]*len(self.peptides_keys)) + ")"
         self.statement_peptides_meta_inner_values = "(" + ",".join(["%s"]*len(self.peptides_meta_keys)) + ")"
 
+        # Create the session-local staging tables for COPY-based inserts
+        self._create_peptides_stage(kwargs["mass_dict_type"])
+
+    def _create_peptides_stage(self, mass_dict_type=int):
+        """
+        Create the staging tables for COPY-based inserts. Rows are COPYed
+        into these tables (bandwidth-bound, no per-row parse/bind) and moved
+        into the actual tables with a single INSERT ... SELECT afterwards.
+
+        The tables are TEMP, so they are private per process/connection and skip WAL.
+        The meta stage lives on the dedicated meta connection (see start_up).
+        """
+        try:
+            cur = self.conn.cursor()
+            cur_meta = self.conn_meta.cursor()
+            if not self.postgres_no_duplicates:
+                # The no-duplicates path generates its own ids and does not stage peptides
+                cur.execute(
+                    "CREATE TEMP TABLE IF NOT EXISTS peptides_stage AS SELECT {} FROM peptides WITH NO DATA".format(
+                        ",".join(self.peptides_keys)
+                    )
+                )
+            cur_meta.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS peptides_meta_stage AS SELECT {} FROM peptides_meta"
+                " WITH NO DATA".format(",".join(self.peptides_meta_keys))
+            )
+        except Exception as e:
+            print("Warning: Failed creating staging tables (Reason: {})".format(str(e)))
+        finally:
+            self.conn.commit()
+            self.conn_meta.commit()
+            cur.close()
+            cur_meta.close()
+            # The peptides are COPYed in binary format, which skips the text
+            # serialization/parsing of every field (types as in _create_tables)
+            self.statement_peptides_copy = "COPY peptides_stage({}) FROM STDIN (FORMAT BINARY)".format(
+                ",".join(self.peptides_keys)
+            )
+            self.statement_peptides_copy_types = \
+                ["int8" if mass_dict_type is int else "float8"] + ["int2"]*26 + ["text", "text"]
+            self.statement_peptides_stage_insert = "INSERT INTO peptides({0}) SELECT {0} FROM peptides_stage" \
+                " RETURNING id".format(",".join(self.peptides_keys))
+            self.statement_peptides_meta_copy = "COPY peptides_meta_stage({}) FROM STDIN".format(
+                ",".join(self.peptides_meta_keys)
+            )
+            self.statement_peptides_meta_flush = "INSERT INTO peptides_meta({0}) SELECT {0}" \
+                " FROM peptides_meta_stage".format(",".join(self.peptides_meta_keys))
+
     def export(self, prot_graph, queue):
         # First insert accession into accession table and retrieve its id:
-        # since we only do this per protein!
-        with self.conn.transaction():
-            accession = prot_graph.vs[0]["accession"]
+        # since we only do this per protein! (cached across proteins)
+        accession = prot_graph.vs[0]["accession"]
+        self.accession_id = self.accession_ids.get(accession)
+        if self.accession_id is None:
             self.cursor.execute(
                 self.statement_accession,
                 (accession,)
             )
             self.accession_id = self.cursor.fetchone()[0]
+            self.accession_ids[accession] = self.accession_id
 
         # Then we continue with the export function
         super().export(prot_graph, queue)
 
-        # and commit everything in the conenction for a protein
-        self.conn.commit()
+        # Move all staged meta rows of this protein over at once
+        # (on the meta connection, so peptides and meta commit independently)
+        self.cursor_meta.execute(self.statement_peptides_meta_flush)
+        self.cursor_meta.execute("TRUNCATE peptides_meta_stage")
+
+        # and commit everything in both conenctions once per batch of proteins
+        self.proteins_since_commit += 1
+        if self.proteins_since_commit >= self.commit_every_n_proteins:
+            self.conn.commit()
+            self.conn_meta.commit()
+            self.proteins_since_commit = 0
 
     def export_peptides(self, prot_graph, l_path_nodes, l_path_edges, l_peptide, l_miscleavages, _):
         # Get the weight
@@ -180,106 +279,123 @@ class PepPostgres(APeptideExporter):
         else:
             l_weight = [-1]*len(l_path_nodes)
 
+        # Count the aminoacids of the whole batch in one vectorized pass
+        # (instead of 26 full string scans per peptide): all peptides are
+        # concatenated into one byte array and summed up per peptide segment
+        flat = np.frombuffer("".join(l_peptide).encode("ascii"), dtype=np.uint8)
+        offsets = np.zeros(len(l_peptide), dtype=np.int64)
+        np.cumsum([len(p) for p in l_peptide[:-1]], out=offsets[1:])
+        counts = np.empty((len(l_peptide), len(self.aa_codes)), dtype=np.int32)
+        for idx, code in enumerate(self.aa_codes):
+            counts[:, idx] = np.add.reduceat((flat == code).astype(np.int32), offsets)
+
         # Set the output tuple list
         l_peptides_tup = [
             (
                 weight,  # Counts of Aminoacids
-                peptide.count("A"), peptide.count("B"), peptide.count("C"), peptide.count("D"), peptide.count("E"),
-                peptide.count("F"), peptide.count("G"), peptide.count("H"), peptide.count("I"), peptide.count("J"),
-                peptide.count("K"), peptide.count("L"), peptide.count("M"), peptide.count("N"), peptide.count("O"),
-                peptide.count("P"), peptide.count("Q"), peptide.count("R"), peptide.count("S"), peptide.count("T"),
-                peptide.count("U"), peptide.count("V"), peptide.count("W"), peptide.count("X"), peptide.count("Y"),
-                peptide.count("Z"),  # N and C Terminus
+                *aa_counts,  # N and C Terminus
                 peptide[0], peptide[-1]
             )
-            for peptide, weight in zip(l_peptide, l_weight)
+            for peptide, weight, aa_counts in zip(l_peptide, l_weight, counts.tolist())
         ]
 
         # Insert new entry into database:
         if self.postgres_no_duplicates:
             self.conn.commit()  # Commit changes, we may need to reapply peptides (when deadlocks are caused)
-            l_peptides_id = self._export_peptide_no_duplicate(l_peptides_tup, l_path_nodes, l_miscleavages)
+            # Insert the peptides within one libpq pipeline, so the chunked
+            # inserts are sent back-to-back with a single sync instead of
+            # paying a full round-trip per chunk.
+            # In pipeline mode a failing statement (e.g. a deadlock) does NOT
+            # raise at its execute call but at/after the sync, so the retry
+            # has to wrap the whole pipeline block and re-run the full batch.
+            # This is safe: the ids are generated client-side and all inserts
+            # are ON CONFLICT DO NOTHING
+            while True:
+                try:
+                    with self.conn.pipeline():
+                        l_peptides_id = self._export_peptide_no_duplicate(
+                            l_peptides_tup, l_path_nodes, l_miscleavages
+                        )
+                    break
+                except Exception:
+                    self.conn.rollback()
         else:
             l_peptides_id = self._export_peptide_simple_insert(l_peptides_tup, l_path_nodes, l_miscleavages)
 
-        # Bulk insert meta data information of peptides (ALWAYS)
-        l_peptides_meta_tup = [
-            (
-                peptides_id,
-                self.accession_id,
-                path_nodes,
-                miscleavages
-            )
-            for peptides_id, path_nodes, miscleavages in zip(l_peptides_id, l_path_nodes, l_miscleavages)
-        ]
-        for in_l_peptides_meta_tup in self.chunked_iterable(
-            l_peptides_meta_tup, self.pg_max_allowed_entries_to_send_meta
-        ):
-            # Bulk insert statement and execute
-            stmt = "INSERT INTO peptides_meta (" \
-                + ",".join(self.peptides_meta_keys) \
-                + ") VALUES " \
-                + ",".join([self.statement_peptides_meta_inner_values]*len(in_l_peptides_meta_tup))
-            self.cursor.execute(stmt, [y for x in in_l_peptides_meta_tup for y in x])
+        # Stage meta data information of peptides (ALWAYS). The staged rows are
+        # flushed into peptides_meta once per protein (see export)
+        # NOTE: COPY cannot run inside a pipeline block
+        self._export_peptides_meta(l_peptides_id, l_path_nodes, l_miscleavages)
+
+    def _export_peptides_meta(self, l_peptides_id, l_path_nodes, l_miscleavages):
+        """ Stream the meta data information of peptides into the staging table """
+        with self.cursor_meta.copy(self.statement_peptides_meta_copy) as copy:
+            for peptides_id, path_nodes, miscleavages in zip(l_peptides_id, l_path_nodes, l_miscleavages):
+                # The path is packed into raw int32 bytes, which is much cheaper
+                # to serialize (and store) than the INT[] array literal
+                copy.write_row((peptides_id, self.accession_id, array("i", path_nodes).tobytes(), miscleavages))
 
     def _export_peptide_simple_insert(self, l_peptides_tup, l_path_nodes, l_miscleavages):
-        """ Simply export them by using simple bulk insert statements """
-
-        all_ids_fetched = []
-        for in_l_peptides_tup in self.chunked_iterable(l_peptides_tup, self.pg_max_allowed_entries_to_send):
-            stmt = "INSERT INTO peptides (" \
-                + ",".join(self.peptides_keys) \
-                + ") VALUES " \
-                + ",".join([self.statement_peptides_inner_values]*len(in_l_peptides_tup)) \
-                + " returning id"
-            self.cursor.execute(stmt, [y for x in in_l_peptides_tup for y in x])
-            peptides_id_fetched = self.cursor.fetchall()
-            all_ids_fetched.extend([x[0] for x in peptides_id_fetched])
+        """ Export peptides by staging them via COPY and moving them over in one statement """
+
+        # Stream all rows into the staging table. COPY skips the per-row
+        # parse/bind/execute of INSERTs, making this path bandwidth-bound
+        with self.cursor.copy(self.statement_peptides_copy) as copy:
+            copy.set_types(self.statement_peptides_copy_types)
+            for tup in l_peptides_tup:
+                copy.write_row(tup)
+
+        # Move staged rows into peptides, retrieving the generated ids
+        # (returned in insertion order) and clear the stage for the next batch
+        self.cursor.execute(self.statement_peptides_stage_insert)
+        all_ids_fetched = [x[0] for x in self.cursor.fetchall()]
+        self.cursor.execute("TRUNCATE peptides_stage")
         return all_ids_fetched
 
     def _export_peptide_no_duplicate(self, l_peptides_tup, l_path_nodes, l_miscleavages):
         """ Export peptides ONLY if it is not already inserted into the peptides table """
         # Map peptides to 452 many bits (as id)
-        pep_ids = [
-            "".join(
-                # Here we use for the aa-counts 17 bits (each)
-                # followed by 5 bits for the n and c terminus (ascii_code - 65)
-                # The weight is disregarded, since it is composed by the aa counts
-                [format(i, 'b').zfill(17) for i in x[1:-2]] \
-                + [format(ord(i) - 65, 'b').zfill(5) for i in x[-2:]]
-            )
-            for x in l_peptides_tup
-        ]
+        # Here we use for the aa-counts 17 bits (each)
+        # followed by 5 bits for the n and c terminus (ascii_code - 65)
+        # The weight is disregarded, since it is composed by the aa counts
+        # We pack everything into one int first, so the bitstring is
+        # formatted exactly once per peptide (instead of 28 times)
+        pep_ids = []
+        for x in l_peptides_tup:
+            bits = 0
+            for count in x[1:-2]:
+                bits = (bits << 17) | count
+            bits = (bits << 5) | (ord(x[-2]) - 65)
+            bits = (bits << 5) | (ord(x[-1]) - 65)
+            pep_ids.append(format(bits, "b").zfill(452))
 
         for zipped in self.chunked_iterable(
             zip(l_peptides_tup, pep_ids), self.pg_max_allowed_entries_to_send_compressed
         ):
-            # Bulk insert into the peptides table
-            ins_stmt = " INSERT INTO peptides (" \
-                + ",".join(self.peptides_keys) \
-                + ") VALUES " \
-                + ",".join([self.statement_peptides_inner_values]*len(zipped)) \
-                + " ON CONFLICT DO NOTHING"
-            self._execute_export_no_duplicates(
-                ins_stmt,
-                [y for a, b in zipped for y in [b] + list(a)]
-            )
+            # Bulk insert into the peptides table (statement cached per chunk size)
+            ins_stmt = self.statement_peptides_no_dup.get(len(zipped))
+            if ins_stmt is None:
+                ins_stmt = " INSERT INTO peptides (" \
+                    + ",".join(self.peptides_keys) \
+                    + ") VALUES " \
+                    + ",".join([self.statement_peptides_inner_values]*len(zipped)) \
+                    + " ON CONFLICT DO NOTHING"
+                self.statement_peptides_no_dup[len(zipped)] = ins_stmt
+            # No per-chunk retry here: failures surface at the pipeline sync
+            # and are handled by the batch-level retry in export_peptides
+            self.cursor.execute(ins_stmt, [y for a, b in zipped for y in [b] + list(a)])
 
         # No need to fetch ids, since we generate them ourselves!
         return pep_ids
 
-    def _execute_export_no_duplicates(self, statement, entries):
-        # Execute statement. Retry if failed.
-        try:
-            self.cursor.execute(statement, entries)
-        except Exception:
-            self.conn.rollback()
-            self._execute_export_no_duplicates(statement, entries)
-
     def tear_down(self):
-        # Close the connection to postgres
+        # Close both connections to postgres
         try:
-            self.cursor.close()  # Close cursor
-            self.conn.close()  # Close connection
+            self.conn.commit()  # Commit the last (partial) batch of proteins
+            self.conn_meta.commit()
+            self.cursor.close()  # Close cursors
+            self.cursor_meta.close()
+            self.conn.close()  # Close connections
+            self.conn_meta.close()
         except Exception as e:
             print("Connection to PostgreSQL  could not be closed. (Reason: {})".format(str(e)))
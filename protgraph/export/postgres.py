@@ -1,5 +1,5 @@
-import json
-
+import numpy as np
+import orjson
 import psycopg
 from Bio.SeqFeature import FeatureLocation
 from Bio.SwissProt import FeatureTable
@@ -7,6 +7,9 @@ from Bio.SwissProt import FeatureTable
 from protgraph.export.abstract_exporter import AExporter
 from protgraph.graph_collapse_edges import Or
 
+# Serialize subclasses (like Or) via the default-handler and allow non-string dict keys
+_ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_SUBCLASS | orjson.OPT_NON_STR_KEYS
+
 
 class Postgres(AExporter):
     """
@@ -38,6 +41,10 @@ class Postgres(AExporter):
             )
             # Set a cursor
             self.cursor = self.conn.cursor(binary=True)
+            # Bulk-load session: do not wait for the WAL fsync on commit.
+            # Session-local setting; on a crash the last commits may be lost,
+            # but the database itself stays consistent
+            self.cursor.execute("SET synchronous_commit = OFF")
         except Exception as e:
             raise Exception("Could not establish a connection to Postgres.", e)
 
@@ -110,6 +117,14 @@ class Postgres(AExporter):
                 "qualifiers"
             ]
 
+        # Precompile the insert statements; they are fixed per exporter instance
+        self.statement_nodes = "INSERT INTO nodes({}) VALUES ({}) RETURNING id".format(
+            ",".join(self.nodes_keys), ",".join(["%s"]*len(self.nodes_keys))
+        )
+        self.statement_edges_copy = "COPY edges({}) FROM STDIN".format(
+            ",".join(["source", "target"] + self.edges_keys)
+        )
+
     def export(self, prot_graph, _):
         # Export the protein
         self._export(prot_graph)
@@ -125,75 +140,88 @@ class Postgres(AExporter):
     def _export(self, prot_graph):
         # Add nodes and edges to the graph
 
-        # Create table information for graph nodes
-        db_nodes = [
-            self._get_node_edge_attrs(x.attributes(), self.nodes_keys)
-            for x in prot_graph.vs[:]
-        ]
-
-        # Create SQL statement to insert all nodes (bulk)
-        inner_insert_tuple = ",".join(["%s"]*len(self.nodes_keys))
-        insert_tuples = ",".join(["({})".format(inner_insert_tuple)]*len(db_nodes))
-        statement = "INSERT INTO nodes({}) VALUES ".format(",".join(self.nodes_keys)) \
-                    + insert_tuples + " RETURNING id"
-
-        # Add the values into the statement and execute
-        self.cursor.execute(statement, [y for x in db_nodes for y in x])
-
-        # Get returning ids of the nodes
-        node_ids_bulk = self.cursor.fetchall()
-
-        # Create mapping of postgres-IDs and graph IDs and map the edges to it
-        node_ids = [x[0] for x in node_ids_bulk]
-        sources = [node_ids[x.source] for x in prot_graph.es[:]]
-        targets = [node_ids[x.target] for x in prot_graph.es[:]]
-
-        # Create remaining table information for graph edges
-        db_edges = [
-            self._get_node_edge_attrs(x.attributes(), self.edges_keys)
-            for x in prot_graph.es[:]
-        ]
-
-        # Concatenate the complete information
-        db_edges_full = [None]*len(db_edges)
-        for idx, k in enumerate(zip(sources, targets, db_edges)):
-            db_edges_full[idx] = [k[0], k[1]] + k[2]
-
-        # Create SQL statement for adding 1 edge into postgres
-        e_inner_insert_tuple = ",".join(["%s"]*len(["source", "target"] + self.edges_keys))
-        e_statement = "INSERT INTO edges({}) VALUES ".format(",".join(["source", "target"] + self.edges_keys)) \
-                      + "({})".format(e_inner_insert_tuple)
-
-        # Execute this statement on each edge entry
-        self.cursor.executemany(e_statement, db_edges_full)
+        # Serialization cache for this export call. Many edges of a protein
+        # share the very same qualifiers object (e.g. a variant spanning many
+        # edges), so each distinct object is serialized to JSON only once
+        qualifiers_cache = {}
+
+        # Create table information for graph nodes (column-wise, see below)
+        db_nodes = list(zip(*self._get_attr_columns(prot_graph.vs, self.nodes_keys, qualifiers_cache)))
+
+        # Insert all nodes at once. Psycopg batches the executions internally,
+        # so we do not need to build a giant VALUES statement by hand
+        self.cursor.executemany(self.statement_nodes, db_nodes, returning=True)
+
+        # Get returning ids of the nodes (one result set per inserted row)
+        node_ids = []
+        while True:
+            node_ids.append(self.cursor.fetchone()[0])
+            if not self.cursor.nextset():
+                break
+
+        # Create mapping of postgres-IDs and graph IDs and map the edges to it.
+        # get_edgelist() returns all source/target pairs in one C call and the
+        # id lookup is done via vectorized fancy-indexing instead of |E| Python loops
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        edge_list = np.asarray(prot_graph.get_edgelist(), dtype=np.int64)
+        sources = node_ids[edge_list[:, 0]].tolist()
+        targets = node_ids[edge_list[:, 1]].tolist()
+
+        # Create remaining table information for graph edges (column-wise, see below)
+        db_edges = zip(*self._get_attr_columns(prot_graph.es, self.edges_keys, qualifiers_cache))
+
+        # Stream all edges at once via COPY. This skips the per-row parse/bind/execute
+        # round-trips of an INSERT per edge (edges usually outnumber nodes by far).
+        # The rows are streamed directly, without concatenating them into a full list
+        with self.cursor.copy(self.statement_edges_copy) as copy:
+            for source, target, attrs in zip(sources, targets, db_edges):
+                copy.write_row((source, target, *attrs))
 
         # Commit conenction
         self.conn.commit()
 
-    def _get_node_edge_attrs(self, node_edge_attrs, key_list):
-        """ Get values of nodes/edges, returning None if not present """
-        attrs_l = [None]*len(key_list)
-        # Return list of node attrs
-        for idx, ele in enumerate(key_list):
-            if ele in node_edge_attrs:
-                if ele == "qualifiers":
-                    # Special Case for qualifiers here we do JSON!
-                    attrs_l[idx] = json.dumps(self._get_attributes(node_edge_attrs[ele]))
-                else:
-                    attrs_l[idx] = node_edge_attrs[ele]
-        return attrs_l
-
-    def _get_attributes(self, attrs):
-        """ Convert qualifiers objects into JSON-Serializable objects """
+    def _get_attr_columns(self, vertex_or_edge_seq, key_list, qualifiers_cache):
+        """
+        Get values of nodes/edges column-wise (one list per key in key_list).
+
+        Fetching whole attribute columns avoids materializing a dict of ALL
+        attributes per vertex/edge; missing attributes yield None-columns.
+        The qualifiers_cache is passed in per export call (see _export).
+        """
+        available_attrs = set(vertex_or_edge_seq.attributes())
+        columns = []
+        for ele in key_list:
+            if ele not in available_attrs:
+                columns.append([None]*len(vertex_or_edge_seq))
+            elif ele == "qualifiers":
+                # Special Case for qualifiers here we do JSON!
+                columns.append([self._serialize_qualifiers(x, qualifiers_cache) for x in vertex_or_edge_seq[ele]])
+            else:
+                columns.append(vertex_or_edge_seq[ele])
+        return columns
+
+    def _serialize_qualifiers(self, qualifiers, qualifiers_cache):
+        """ Serialize the qualifiers of a single edge into JSON (cached by object identity) """
+        key = id(qualifiers)
+        serialized = qualifiers_cache.get(key)
+        if serialized is None:
+            serialized = orjson.dumps(qualifiers, default=self._qualifiers_default, option=_ORJSON_OPTIONS).decode()
+            qualifiers_cache[key] = serialized
+        return serialized
+
+    def _qualifiers_default(self, attrs):
+        """ Convert the qualifiers objects, which orjson cannot serialize natively """
         if isinstance(attrs, Or):
-            return {"or": [self._get_attributes(x) for x in attrs]}
-        if isinstance(attrs, list):
-            return [self._get_attributes(x) for x in attrs]
-        elif isinstance(attrs, dict):
-            return {self._get_attributes(x): self._get_attributes(y) for x, y in attrs.items()}
+            return {"or": list(attrs)}
         elif isinstance(attrs, FeatureLocation):
             return [attrs.nofuzzy_start, attrs.nofuzzy_end]
         elif isinstance(attrs, FeatureTable):
-            return {self._get_attributes(x): self._get_attributes(y) for x, y in attrs.__dict__.items()}
+            return attrs.__dict__
+        elif isinstance(attrs, tuple):
+            return list(attrs)
+        elif isinstance(attrs, str):
+            return str(attrs)
+        elif isinstance(attrs, int):
+            return int(attrs)
         else:
-            return attrs
+            raise TypeError
@@ -31,8 +31,15 @@ def collapse_parallel_edges(graph):
     since it may happen that if they are applied unordered, that an parallel edge is never drawn.
     (tested on Q9R2E6, 1 out of 6 order possibilities did not yield the parallel edge! (132 for reference))
     """
-    # Go through each node
-    for x in range(0, graph.vcount()):
+    # Parallel edges are extremely rare (see issue above). Detect them with a
+    # single C call and resolve only the affected source nodes in Python
+    multiples = graph.is_multiple()
+    if not any(multiples):
+        return
+    affected_sources = {graph.es[idx].source for idx, multiple in enumerate(multiples) if multiple}
+
+    # Go through each affected node
+    for x in affected_sources:
         k_edges = graph.vs[x].out_edges()
         k_targets = [x.target for x in k_edges]
         k_set = set(k_targets)
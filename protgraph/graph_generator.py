@@ -1,5 +1,5 @@
+import csv
 import io
-from collections import defaultdict
 
 import igraph
 from Bio import SwissProt
@@ -30,30 +30,45 @@ def _generate_canonical_graph(sequence: str, acc: str):
     This simply generates a chain of nodes and edges and sets
     specific attributes for them.
     """
-    # Initialization of the directed graph (DiGraph)
-    graph = igraph.Graph(directed=True)
-
-    # Initialize the graph with the length of the sequence
-    graph.add_vertices(len(sequence) + 2)  # +2 -> adding start and end node here!
-    graph.add_edges([(x1, x1 + 1) for x1 in range(len(sequence) + 1)])
+    # +2 -> adding start and end node here!
+    num_of_nodes = len(sequence) + 2
 
     # Add their amino acid to the corresponding nodes
-    graph.vs["aminoacid"] = ["__start__", *[x for x in sequence], "__end__"]
-
-    # Add position attributes to nodes as well as from which accession they originate
-    graph.vs["position"] = list(range(len(sequence) + 2))  # Set position of aa on every node!
-    graph.vs["accession"] = [acc, *[acc] * len(sequence), acc]  # Set accession on every node!
-
-    return graph
+    aminoacids = ["__start__"]
+    aminoacids.extend(sequence)
+    aminoacids.append("__end__")
+
+    # Initialization of the directed graph (DiGraph) in a single constructor
+    # call, so vertices, edges and their attributes are materialized at once
+    return igraph.Graph(
+        num_of_nodes,
+        [(x1, x1 + 1) for x1 in range(len(sequence) + 1)],
+        directed=True,
+        vertex_attrs=dict(
+            aminoacid=aminoacids,
+            position=list(range(num_of_nodes)),  # Set position of aa on every node!
+            accession=[acc] * num_of_nodes,  # Set accession on every node!
+        ),
+    )
+
+
+# All feature types which are consumed during graph generation.
+# Other types are skipped directly while sorting
+SORTED_FEATURE_TYPES = (
+    "INIT_MET", "SIGNAL", "PROPEP", "PEPTIDE", "CHAIN",
+    "VARIANT", "MUTAGEN", "CONFLICT", "VAR_SEQ"
+)
 
 
 def _sort_entry_features(entry):
-    """ This sorts the features according to their type into a dict. """
-    sorted_features = defaultdict(list)
+    """ This sorts the (consumed) features according to their type into a dict. """
+    sorted_features = {key: [] for key in SORTED_FEATURE_TYPES}
     # For each features
     for f in entry.features:
-        # Append it to a list to its corresponding key -> type
-        sorted_features[f.type].append(f)
+        # Append it to the list of its corresponding key -> type (if consumed at all)
+        bucket = sorted_features.get(f.type)
+        if bucket is not None:
+            bucket.append(f)
 
     # Return the dictionary
     return sorted_features
@@ -62,9 +77,10 @@ def _sort_entry_features(entry):
 def _include_spefic_ft(graph, ft_type, method, sorted_features, ft_dict):
     """ Execute features individually """
     num_of_feature_type = 0 if ft_type in ft_dict else None
-    if ft_type in sorted_features and ft_type in ft_dict:
-        num_of_feature_type = len(sorted_features[ft_type])
-        for f in sorted_features[ft_type]:
+    features = sorted_features[ft_type]
+    if features and ft_type in ft_dict:
+        num_of_feature_type = len(features)
+        for f in features:
             method(graph, f)
     return num_of_feature_type
 
@@ -95,7 +111,7 @@ def _include_ft_information(entry, graph, ft_dict, entry_dict):
     # since those can be referenced by others
     if "VAR_SEQ" in ft_dict:
         entry_dict["num_var_seq"] = 0
-    if "VAR_SEQ" in sorted_features and "VAR_SEQ" in ft_dict:
+    if sorted_features["VAR_SEQ"] and "VAR_SEQ" in ft_dict:
         # Get isoform information of entry as a dict
         isoforms, num_of_isoforms = _get_isoforms_of_entry(entry.comments, entry.accessions[0])
         entry_dict["num_var_seq"] = num_of_isoforms
@@ -125,80 +141,102 @@ def generate_graph_consumer(entry_queue, graph_queue, common_out_queue, proc_id,
         for i in kwargs["feature_table"]:
             ft_dict[i] = True
 
+    # Batch the statistics rows, so that each queue put ships many rows at
+    # once (one pickle + one IPC round trip per batch instead of per protein).
+    # The rows are CSV-formatted right here, on the parallel consumers, so
+    # the single writer thread only needs to write out the shipped block.
+    # Without an output_csv the graph_queue is None and no rows are built
+    stats_batch = io.StringIO()
+    stats_writer = csv.writer(stats_batch)
+    stats_batch_rows = 0
+    stats_batch_size = 64
+
     # Initialize the exporters for graphs
     with Exporters(**kwargs) as graph_exporters:
 
         while True:
-            # Get next entry
-            io_entry = entry_queue.get()
+            # Get next batch of entries (the reader ships them batchwise)
+            io_batch = entry_queue.get()
 
-            # Stop if entry is None
-            if io_entry is None:
+            # Stop if batch is None
+            if io_batch is None:
                 # --> Stop Condition of Process
                 break
 
-            # Parse entry in graph generation process, so that more work is done in the consumer
-            entry = SwissProt.read(io.BytesIO(io_entry))
+            for io_entry in io_batch:
+                # Parse entry in graph generation process, so that more work is done in the consumer
+                entry = SwissProt.read(io.BytesIO(io_entry))
+
+                if kwargs["exclude_accessions"] and entry.accessions[0] in kwargs["exclude_accessions"]:
+                    # This effectively skips an entry at the cost to check whether to skip in EACH entry!
+                    continue
 
-            if kwargs["exclude_accessions"] and entry.accessions[0] in kwargs["exclude_accessions"]:
-                # This effectively skips an entry at the cost to check whether to skip in EACH entry!
-                continue
+                # create new dict to collect information about this entry
+                entry_dict = dict()
 
-            # create new dict to collect information about this entry
-            entry_dict = dict()
+                # Beginning of Graph-Generation
+                # We also collect interesting information here!
 
-            # Beginning of Graph-Generation
-            # We also collect interesting information here!
+                # Generate canonical graph (initialization of the graph)
+                graph = _generate_canonical_graph(entry.sequence, entry.accessions[0])
 
-            # Generate canonical graph (initialization of the graph)
-            graph = _generate_canonical_graph(entry.sequence, entry.accessions[0])
+                # FT parsing and appending of nodes and edges into the graph
+                # The amount of isoforms, etc.. can be retrieved on the fly
+                _include_ft_information(entry, graph, ft_dict, entry_dict)
 
-            # FT parsing and appending of nodes and edges into the graph
-            # The amount of isoforms, etc.. can be retrieved on the fly
-            _include_ft_information(entry, graph, ft_dict, entry_dict)
+                # Replace Amino Acids based on user defined rules: E.G.: "X -> A,B,C"
+                replace_aa(graph, kwargs["replace_aa"])
 
-            # Replace Amino Acids based on user defined rules: E.G.: "X -> A,B,C"
-            replace_aa(graph, kwargs["replace_aa"])
+                # Digest graph with enzyme (unlimited miscleavages)
+                digest(graph, kwargs["digestion"], entry_dict)
 
-            # Digest graph with enzyme (unlimited miscleavages)
-            digest(graph, kwargs["digestion"], entry_dict)
+                # Annotate delta masses for PTMs
+                annotate_ptms(graph, kwargs["variable_mod"], kwargs["fixed_mod"], kwargs["mass_dict_factor"])
 
-            # Annotate delta masses for PTMs
-            annotate_ptms(graph, kwargs["variable_mod"], kwargs["fixed_mod"], kwargs["mass_dict_factor"])
+                # Collapse parallel edges in a graph
+                if not kwargs["no_collapsing_edges"]:
+                    collapse_parallel_edges(graph)
 
-            # Collapse parallel edges in a graph
-            if not kwargs["no_collapsing_edges"]:
-                collapse_parallel_edges(graph)
+                # Merge (summarize) graph if wanted
+                if not kwargs["no_merge"]:
+                    merge_aminoacids(graph)
 
-            # Merge (summarize) graph if wanted
-            if not kwargs["no_merge"]:
-                merge_aminoacids(graph)
+                # Annotate weights for edges and nodes (maybe even the smallest weight possible to get to the end node)
+                annotate_weights(graph, **kwargs)
 
-            # Annotate weights for edges and nodes (maybe even the smallest weight possible to get to the end node)
-            annotate_weights(graph, **kwargs)
+                # Calculate statistics on the graph:
+                get_statistics(graph, entry_dict, **kwargs)
 
-            # Calculate statistics on the graph:
-            get_statistics(graph, entry_dict, **kwargs)
+                # Verify graphs if wanted:
+                if kwargs["verify_graph"]:
+                    verify_graph(graph)
 
-            # Verify graphs if wanted:
-            if kwargs["verify_graph"]:
-                verify_graph(graph)
+                # Persist or export graphs with speicified exporters
+                graph_exporters.export_graph(graph, common_out_queue)
 
-            # Persist or export graphs with speicified exporters
-            graph_exporters.export_graph(graph, common_out_queue)
+                # Output statistics we gathered during processing (if wanted at all)
+                if graph_queue is not None:
+                    if kwargs["no_description"]:
+                        entry_dict["protein_description"] = entry_protein_desc = None
+                    else:
+                        entry_protein_desc = entry.description.split(";", 1)[0]
+                        entry_dict["protein_description"] = entry_protein_desc[entry_protein_desc.index("=") + 1:]
 
-            # Output statistics we gathered during processing
-            if kwargs["no_description"]:
-                entry_dict["protein_description"] = entry_protein_desc = None
-            else:
-                entry_protein_desc = entry.description.split(";", 1)[0]
-                entry_dict["protein_description"] = entry_protein_desc[entry_protein_desc.index("=") + 1:]
+                    # Set accession and gene for csv
+                    entry_dict["accession"] = entry.accessions[0]
+                    entry_dict["gene_id"] = entry.entry_name
 
-            # Set accession and gene for csv
-            entry_dict["accession"] = entry.accessions[0]
-            entry_dict["gene_id"] = entry.entry_name
+                    # Collect the statistics which were retrieved and flush them batchwise
+                    stats_writer.writerow(
+                        [entry_dict[x] if x in entry_dict else None for x in kwargs["output_csv_layout"]]
+                    )
+                    stats_batch_rows += 1
+                    if stats_batch_rows >= stats_batch_size:
+                        graph_queue.put((stats_batch_rows, stats_batch.getvalue()))
+                        stats_batch.seek(0)
+                        stats_batch.truncate()
+                        stats_batch_rows = 0
 
-            # Return the statistics which were retrieved
-            graph_queue.put(
-                [entry_dict[x] if x in entry_dict else None for x in kwargs["output_csv_layout"]]
-            )
+        # Flush the last (partial) batch of statistics rows
+        if stats_batch_rows:
+            graph_queue.put((stats_batch_rows, stats_batch.getvalue()))
@@ -1,15 +1,17 @@
 def traverse_to_end(graph_entry, complete_chain, single_nodes, single_in, next_node, c):
     # iterate as long as possible.
+    # NOTE: successors() returns the plain vertex indices directly,
+    # without materializing a Vertex object per visited node
     while next_node in single_nodes:
         single_nodes.remove(next_node)
         c.append(next_node)
-        next_node = graph_entry.vs[next_node].neighbors(mode="OUT")[0].index
+        next_node = graph_entry.successors(next_node)[0]
 
     # Special case for single in
     if next_node in single_in:
         single_in.remove(next_node)
         c.append(next_node)
-        next_node = graph_entry.vs[next_node].neighbors(mode="OUT")[0].index
+        next_node = graph_entry.successors(next_node)[0]
 
     # Skip chains containing only 1 element
     if len(c) != 1:
@@ -49,18 +51,18 @@ def find_chains(graph_entry):
     # CASE 1: Chain is starting with a single out node
     for so in single_out:
         c = [so]
-        next_node = graph_entry.vs[so].neighbors(mode="OUT")[0].index
+        next_node = graph_entry.successors(so)[0]
 
         traverse_to_end(graph_entry, complete_chain, single_nodes, single_in, next_node, c)
 
     # CASE 2: it may happen that the start node is at a beginning of chain.
     # Here we do a intersection of remaining nodes in single_nodes with the
     # nodes having a direct connection to start
-    start_set = {x.index for x in __start_node__.neighbors(mode="OUT")}
+    start_set = set(graph_entry.successors(__start_node__.index))
     single_start_points = single_nodes.intersection(start_set)
     for sn in single_start_points:
         c = [sn]
-        next_node = graph_entry.vs[sn].neighbors(mode="OUT")[0].index
+        next_node = graph_entry.successors(sn)[0]
         single_nodes.remove(sn)
 
         traverse_to_end(graph_entry, complete_chain, single_nodes, single_in, next_node, c)
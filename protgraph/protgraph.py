@@ -2,15 +2,11 @@ import argparse
 import csv
 import multiprocessing as mp
 import os
-import time
 from multiprocessing import cpu_count
+from multiprocessing.connection import wait as connection_wait
 from threading import Thread
 
-from tqdm import tqdm
-
 import protgraph.cli as cli
-from protgraph.graph_generator import generate_graph_consumer
-from protgraph.read_embl import read_embl
 
 
 def main():
@@ -20,10 +16,19 @@ def main():
 
 def prot_graph(**kwargs):
     """ MAIN DESCRIPTION TODO """
+    # Imported lazily, so each spawned process only imports what its target
+    # actually needs (the reader e.g. skips the consumer and all exporters)
+    from protgraph.graph_generator import generate_graph_consumer
+    from protgraph.read_embl import read_embl
 
     # Instead of forking, we spawn these processes
-    # They terminate more reliably in this way
-    ctx = mp.get_context("spawn")
+    # They terminate more reliably in this way.
+    # Forkserver behaves the same but forks the workers from a clean
+    # template process, which is much faster than a full spawn per worker
+    if "forkserver" in mp.get_all_start_methods():
+        ctx = mp.get_context("forkserver")
+    else:
+        ctx = mp.get_context("spawn")
 
     prot_graph_args = get_defaults_args()  # Get default values
     prot_graph_args.update(kwargs)
@@ -32,18 +37,28 @@ def prot_graph(**kwargs):
     if "files" not in kwargs or kwargs["files"] is None:
         raise TypeError("missing argument 'files'")
 
+    # Get the number of processes.
+    number_of_procs = \
+        cpu_count() - 1 if prot_graph_args["num_of_processes"] is None else prot_graph_args["num_of_processes"]
+    prot_graph_args["num_of_processes"] = number_of_procs
+
+    # If no queue size is given, derive it from the number of consumers:
+    # a few batches in flight per consumer hide their jitter, without
+    # buffering a large part of the (possibly huge) input in memory
     queue_size = prot_graph_args["queue_size"]
+    if queue_size is None:
+        queue_size = max(4 * number_of_procs, 32)
 
     # Set up queues
     entry_queue = ctx.Queue(queue_size)
-    statistics_queue = ctx.Queue(queue_size)
+    # The statistics rows are small and only consumed by a local thread:
+    # a SimpleQueue writes directly into the pipe on put, without the
+    # feeder thread (and its extra pickle/GIL hop per item) of a full Queue.
+    # Without an output_csv no statistics are needed: the consumers then
+    # get None and skip generating/shipping the rows altogether
+    statistics_queue = ctx.SimpleQueue() if prot_graph_args["output_csv"] is not None else None
     common_out_file_queue = ctx.Queue(queue_size)
 
-    # Get the number of processes.
-    number_of_procs = \
-        cpu_count() - 1 if prot_graph_args["num_of_processes"] is None else prot_graph_args["num_of_processes"]
-    prot_graph_args["num_of_processes"] = number_of_procs
-
     # Create processes
     entry_reader = ctx.Process(
         target=read_embl,
@@ -51,73 +66,93 @@ def prot_graph(**kwargs):
             prot_graph_args["files"], entry_queue
         )
     )
+    # The consumers get the argument dict as kwargs; it is pickled once per
+    # worker, so trim the entries only the main process needs beforehand
+    graph_gen_args = {
+        key: value for key, value in prot_graph_args.items()
+        if key not in ("files", "num_of_entries", "output_csv", "queue_size")
+    }
     graph_gen = [
         ctx.Process(
             target=generate_graph_consumer, args=(entry_queue, statistics_queue, common_out_file_queue, i),
-            kwargs=prot_graph_args
+            kwargs=graph_gen_args
         )
         for i in range(number_of_procs)
     ]
-    main_write_thread = Thread(
-        target=write_output_csv_thread,
-        args=(statistics_queue, prot_graph_args["output_csv"], prot_graph_args["num_of_entries"],),
-        kwargs=kwargs
-    )
     common_out_thread = Thread(
         target=write_to_common_file,
         args=(common_out_file_queue,)
     )
+    # The supervision runs on a small coordinator thread, so the main
+    # thread itself can execute the statistics writer (see below)
+    coordinator_thread = Thread(
+        target=__supervise_processes,
+        args=(entry_reader, graph_gen, entry_queue, statistics_queue, common_out_file_queue)
+    )
 
     # Start processes/threads in reverse!
     common_out_thread.start()
-    main_write_thread.start()
     for p in graph_gen:
         p.start()
     entry_reader.start()
+    coordinator_thread.start()
+
+    # Pin each consumer to a fixed core (Linux only), so the scheduler does
+    # not migrate them across cores, invalidating their caches mid-graph.
+    # With the default of cpu_count() - 1 consumers, one core is left over
+    # for the producer and the writing threads
+    if hasattr(os, "sched_setaffinity"):
+        for i, p in enumerate(graph_gen):
+            os.sched_setaffinity(p.pid, {i % cpu_count()})
+
+    # Run the statistics writer directly on the main thread (instead of a
+    # dedicated thread), it returns once the coordinator sent the sentinel
+    if statistics_queue is not None:
+        write_output_csv_thread(
+            statistics_queue, prot_graph_args["output_csv"], prot_graph_args["num_of_entries"], **kwargs
+        )
+    coordinator_thread.join()
+    common_out_thread.join()
 
-    # Check processes and Threads in Reverse
-    graph_gen_stop_sent = False
-    main_write_threads_stop_sent = False
-    while True:
-        time.sleep(1)
-
-        # Do Side-Effect of "joining" to remove zombie processes
-        # see: https://docs.python.org/3/library/multiprocessing.html#multiprocessing.active_children
-        _ = ctx.active_children()
-
-        # Are writing threads alive?
-        if not main_write_thread.is_alive() and not common_out_thread.is_alive():
-            # check if reader is still alive (in case of exceptions)
-            if __check_if_alive([entry_reader]):
-                entry_reader.kill()
-
-            # Then exit the program
-            break
-
-        # Are all consumers still alive?
-        if not __check_if_alive(graph_gen) and not main_write_threads_stop_sent:
-            # Add None to the last queue to stop thread
-            statistics_queue.put(None)
-            common_out_file_queue.put(None)
-            main_write_threads_stop_sent = True
-            continue
 
-        # Is producer still alive?
-        if not __check_if_alive([entry_reader]) and not graph_gen_stop_sent:
-            # Add None, to stop all processes
-            for _ in range(number_of_procs):
+def __supervise_processes(entry_reader, graph_gen, entry_queue, statistics_queue, common_out_file_queue):
+    """
+    Supervise the processes event-driven via their sentinels: wait()
+    blocks until a process exits, so each transition fires immediately
+    instead of being detected by an is_alive poll every second.
+    Stops the writing threads once all processes are finished.
+    """
+    pending = dict((p.sentinel, p) for p in [entry_reader, *graph_gen])
+    graph_gen_stop_sent = False
+    while pending:
+        # Join all exited processes (also removing the zombie processes)
+        for sentinel, proc in list(pending.items()):
+            if proc.exitcode is not None:
+                proc.join()
+                del pending[sentinel]
+
+        consumers_alive = any(p.is_alive() for p in graph_gen)
+
+        # Producer finished: add None, to stop all consumers
+        if not entry_reader.is_alive() and consumers_alive and not graph_gen_stop_sent:
+            for _ in range(len(graph_gen)):
                 entry_queue.put(None)
             graph_gen_stop_sent = True
-            continue
 
+        # All consumers finished while the producer is still running
+        # (in case of exceptions): the remaining entries can never be
+        # delivered anymore, so stop the producer as well
+        if not consumers_alive and entry_reader.is_alive():
+            entry_reader.kill()
 
-def __check_if_alive(processes):
-    """
-    Quickly check if at least one of the list of processes is alive.
-    Returns True if at least one process is still running.
-    """
-    c = set([x.exitcode for x in processes])
-    return None in c
+        # Block until the next process exits
+        if pending:
+            connection_wait(list(pending))
+
+    # All processes are done: stop the writing threads
+    if statistics_queue is not None:
+        statistics_queue.put(None)
+    common_out_file_queue.put(None)
 
 
 def format_help(parser, groups=None):
@@ -147,8 +182,21 @@ def format_help(parser, groups=None):
     return formatter.format_help()
 
 
+# The lazily built parser singleton (see create_parser)
+_parser = None
+
+
 def create_parser():
-    """ Creates the argument parser, using all methods from cli.py """
+    """
+    Creates the argument parser, using all methods from cli.py.
+
+    The parser is built only once per process (~50 add_argument calls)
+    and reused, since both parse_args and get_defaults_args need it.
+    """
+    global _parser
+    if _parser is not None:
+        return _parser
+
     # Set parser without help
     parser = argparse.ArgumentParser(
         description="ProtGraph: a graph generator for proteins and/or peptides and exporter to various formats",
@@ -212,7 +260,8 @@ def create_parser():
         group = parser.add_argument_group(name)
         func(group)
 
-    # Return the parser
+    # Memoize and return the parser
+    _parser = parser
     return parser
 
 
@@ -229,6 +278,9 @@ def parse_args(args=None):
         if action.default is not argparse.SUPPRESS:
             parsed_args[action.dest] = getattr(args, action.dest)
 
+    # Validate all input files at once (one directory scan per folder)
+    cli.check_if_files_exist(parsed_args["files"])
+
     return parsed_args
 
 
@@ -250,28 +302,36 @@ def write_output_csv_thread(queue, out_file, total_num_entries, **kwargs):
         The statistics writing thread, which writes to 'out_file', overwriting its
         contents if existing.
     """
-    # Generate Progrssbar
-    pbar = tqdm(total=total_num_entries, unit="proteins")
+    # Only this writer needs tqdm, keep it out of the module import
+    from tqdm import tqdm
+
+    # Generate Progrssbar. The updates arrive batchwise (one per stats
+    # batch); smoothing=0 also skips the per-update EMA of the shown rate
+    pbar = tqdm(total=total_num_entries, unit="proteins", smoothing=0, miniters=1000)
 
-    # (Over-)Write to out_file
-    with open(out_file, "w") as out_f:
+    # (Over-)Write to out_file. A large write buffer lets the rows be
+    # flushed in big blocks instead of per line; newline="" additionally
+    # skips the newline translation (as recommended for the csv module)
+    with open(out_file, "w", buffering=1 << 20, newline="") as out_f:
         csv_writer = csv.writer(out_f)
 
         # Write Header Row
         csv_writer.writerow(kwargs["output_csv_layout"])
 
         while True:
-            # Wait and get next result entry
-            next_entry = queue.get()
+            # Wait and get next batch of result entries
+            next_entries = queue.get()
 
-            # check if next_entry is None
+            # check if next_entries is None
             # If it is, we stop
-            if next_entry is None:
+            if next_entries is None:
                 break
 
-            # Write Data Row and update progress
-            csv_writer.writerow(next_entry)
-            pbar.update()
+            # The consumers ship their rows already CSV-formatted as one
+            # block, so only the raw write remains on this thread
+            num_rows, formatted_rows = next_entries
+            out_f.write(formatted_rows)
+            pbar.update(num_rows)
 
     # Close pbar, since we finished
     pbar.close()
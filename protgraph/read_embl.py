@@ -1,43 +1,43 @@
 import mmap
 
 
-def rows(f, chunksize=4096):
+def rows(mm):
     """
-    Split entry and add as bytearray into the queue
-    """
-    curr_row = bytearray()
-    sep_array = bytearray(b"\n//\n")
-
-    # Alternative, which only uses read/find and tell
-    # This is slower but reads the file faster
-    # sep=b'\nID'
-    # while True:
-    #     pos = f.find(sep)
-    #     if pos == -1:
-    #         yield f.read()
-    #         break
-    #     yield f.read(pos - f.tell() + 1)
+    Split the mmapped file into single entries (separated by "\\n//\\n")
 
-    # The Graph Generator parse the entries
-    # offset = 0
-    for chunk in iter(lambda: f.read(chunksize), b''):
-        curr_row.extend(chunk)
-        while True:
-            i = curr_row.split(sep_array, 1)  # If python would allow us to add an offset, this could be even faster!
-            if len(i) == 1:
-                break  # We could update here the offset
-            yield i[0] + sep_array
-            curr_row = i[1]
+    Searching with find directly on the mmap leaves the scanning to the C
+    level and yields each entry as one slice, instead of growing/splitting
+    a bytearray per read chunk
+    """
+    sep = b"\n//\n"
+    pos = 0
+    while True:
+        idx = mm.find(sep, pos)
+        if idx == -1:
+            break
+        yield mm[pos:idx + len(sep)]
+        pos = idx + len(sep)
 
     # Special case, if we have a malformed entry (missing new line at very end of file!)
+    curr_row = mm[pos:]
     if len(curr_row) != 0 and curr_row.endswith(b"\n//"):
         yield curr_row
 
 
-def read_embl(path_to_embls: list, queue):
+def read_embl(path_to_embls: list, queue, batch_size=32):
     """ Reads entries from a list of existing embl files """
+    # The raw entries are shipped in batches, so each queue put pays the
+    # pickle and IPC round trip once per batch instead of once per entry
+    batch = []
     for input_f in path_to_embls:
         with open(input_f, "rb") as in_file:
             with mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ) as mf:
                 for r in rows(mf):
-                    queue.put(r)
+                    batch.append(r)
+                    if len(batch) >= batch_size:
+                        queue.put(batch)
+                        batch = []
+
+    # Put the last (partial) batch of entries
+    if batch:
+        queue.put(batch)
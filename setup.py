@@ -39,12 +39,15 @@ setup(
     include_package_data=True,
     install_requires=packages,
     extras_require={
-        "postgres": ["psycopg>=3.0"],
+        "postgres": ["psycopg>=3.0", "numpy", "orjson"],
         "mysql": ["mysql"],
         "sqlite": ["apsw"],
         "cassandra": ["cassandra-driver"],
         "gremlin": ["gremlinpython"],
         "redis": ["redis", "redisgraph"],
-        "full": ["mysql", "psycopg>=3.0", "apsw", "cassandra-driver", "redis", "redisgraph", "gremlinpython"],
+        "full": [
+            "mysql", "psycopg>=3.0", "numpy", "orjson", "apsw",
+            "cassandra-driver", "redis", "redisgraph", "gremlinpython"
+        ],
     },
 )
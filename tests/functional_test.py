@@ -1,4 +1,5 @@
 import os
+import tempfile
 import unittest
 
 import protgraph
@@ -21,6 +22,12 @@ class FunctionalTest(unittest.TestCase):
         args = protgraph.parse_args([] + self.procs_num + self.example_files)
         protgraph.prot_graph(**args)
 
+    def test_output_csv(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            out_statistics = os.path.join(tmp_dir, "protein_graph_statistics.csv")
+            args = protgraph.parse_args(["-o", out_statistics] + self.procs_num + self.example_files)
+            protgraph.prot_graph(**args)
+
     def test_fm(self):
         args = protgraph.parse_args(["-fm", "C:57.021464"] + self.procs_num + self.example_files)
         protgraph.prot_graph(**args)